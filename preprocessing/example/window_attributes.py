@@ -2,136 +2,253 @@ import os
 import sys
 import json
 import re
-import statistics
 import argparse
-import csv
-from scipy import stats
+import functools
+import multiprocessing
+import operator
+import numpy as np
+
+try:
+    # optional, streams packet stats files so that only one flow is held in memory at a time
+    import ijson
+except ImportError:
+    ijson = None
+try:
+    # optional, much faster JSON decoding for large packet stats files when ijson is not installed
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# DNS name pattern of GeForce NOW video servers
+DNS_NAME_SUFFIX = '.pnt.geforcenow.nvidiagrid.net'
+DNS_NAME_PATTERN = re.compile(r'^\d+(?:-\d+)*\.pnt\.geforcenow\.nvidiagrid\.net$')
+# per-packet fields used for the window attributes: UNIX microsecond timestamp, payload size and direction
+PACKET_DTYPE = np.dtype([('ts', np.int64), ('sz', np.int32), ('up', np.bool_)])
+STAT_NAMES = ['sum', 'mean', 'med', 'min', 'max', 'std', 'kurtosis', 'skew']
+ATTRIBUTE_NAMES = ['ct_sum'] + [f'sz_{stat_name}' for stat_name in STAT_NAMES] + [f'it_{stat_name}' for stat_name in STAT_NAMES]
+# columns of the window attributes array, the sz and it sums are followed by the other statistics in STAT_NAMES order
+CT_SUM, SZ_SUM, IT_SUM = 0, 1, 1 + len(STAT_NAMES)
+# packet count and payload size sum, min and max are integral and written as integers
+INTEGER_COLUMNS = frozenset((CT_SUM, SZ_SUM, SZ_SUM + STAT_NAMES.index('min'), SZ_SUM + STAT_NAMES.index('max')))
+
+
+def _is_video_flow(flow: dict) -> bool:
+    if flow['Protocol'] == 6:
+        # ignore TCP flows
+        return False
+    if flow['RemotePort'] < 10000 or flow['RemotePort']> 20000:
+        # GFN servers use ports between 10000 and 20000
+        return False
+    if flow['LocalPort'] == 49005:
+        # fixed port used for video streams on native GFN apps
+        return True
+    dns_name = flow.get('DNSName')
+    if not dns_name or not dns_name.endswith(DNS_NAME_SUFFIX):
+        # cheap check before the regex, most flows have no or another DNS name
+        return False
+    if DNS_NAME_PATTERN.match(dns_name):
+        # DNS names for video flows typically follow the pattern of "hyphen-separated-ip-address.pnt.geforcenow.nvidiagrid.net"
+        # ignore short flows, likely false positives
+        return len(flow['Packets']) > 10000
+    return False
 
 
 def load_video_flow_packets(file_path: str) -> dict:
-    packet_data = json.load(open(file_path, 'r'))
-    dns_name_pattern = re.compile(r'^\d+(?:-\d+)*\.pnt\.geforcenow\.nvidiagrid\.net$')
-    for flow in packet_data.values():
-        if flow['Protocol'] == 6:
-            # ignore TCP flows
-            continue
-        if flow['RemotePort'] < 10000 or flow['RemotePort']> 20000:
-            # GFN servers use ports between 10000 and 20000
-            continue
-        if flow['LocalPort'] == 49005:
-            # fixed port used for video streams on native GFN apps
-            return flow
-        if re.match(dns_name_pattern, flow['DNSName']):
-            # DNS names for video flows typically follow the pattern of "hyphen-separated-ip-address.pnt.geforcenow.nvidiagrid.net"
-            if len(flow['Packets']) > 10000:
-                # ignore short flows, likely false positives
-                return flow
-    return None
+    """
+    Find the downstream game video flow in a packet stats file.
+    The packets of the returned flow are converted to a structured array of PACKET_DTYPE.
+    """
+    with open(file_path, 'rb') as f:
+        if ijson is not None:
+            # stream one flow at a time instead of loading all flows of the file into memory
+            flows = (flow for _, flow in ijson.kvitems(f, '', use_float=True))
+            video_flow = next((flow for flow in flows if _is_video_flow(flow)), None)
+        else:
+            raw_data = f.read()
+            packet_data = orjson.loads(raw_data) if orjson is not None else json.loads(raw_data)
+            video_flow = next((flow for flow in packet_data.values() if _is_video_flow(flow)), None)
+    if video_flow is not None:
+        packets = video_flow['Packets']
+        video_flow['Packets'] = np.fromiter(map(operator.itemgetter('Timestamp', 'PayloadSize', 'Upstream'), packets),
+                                            dtype=PACKET_DTYPE, count=len(packets))
+    return video_flow
 
 
-def get_base_window_stats(file_path: str, window_size: float, first_n_seconds: float) -> dict[str, list[list[int|float]]]:
+def get_base_window_arrays(file_path: str, window_size: float, first_n_seconds: float) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """
+    Load the downstream payload sizes and inter-arrival times of the video flow as flat arrays.
+    Each entry is a (values, window_idx) pair, grouped by ascending window index with packet order preserved within each window.
+    """
     if os.path.isdir(file_path):
         file_path = os.path.join(file_path, os.path.dirname(file_path).split('/')[-1] + '_packetStats.json')
     flow = load_video_flow_packets(file_path)
     if flow is None:
         raise ValueError("No video flow found in file")
     
-    base_window_stats = {'PayloadSizes': [], 'InterArrivalTimes': []}
+    packets = flow['Packets']
+    base_timestamp = packets['ts'][0]    # UNIX microsecond timestamp
+    # skip upstream packets in video flows
+    downstream_packets = packets[~packets['up']]
+    # convert to seconds since the first packet, the packets themselves are left untouched
+    downstream_timestamps = (downstream_packets['ts'] - base_timestamp) / 1e6
+    downstream_payload_sizes = downstream_packets['sz'].astype(np.int64)    # widened so that per-window sums cannot overflow
+    # only consider packets within the first n seconds
+    exceeded = np.flatnonzero(downstream_timestamps > first_n_seconds)
+    if exceeded.size > 0:
+        downstream_timestamps = downstream_timestamps[:exceeded[0]]
+        downstream_payload_sizes = downstream_payload_sizes[:exceeded[0]]
+    
+    # determine which window each packet belongs to, a packet at exactly first_n_seconds belongs to the last window
     num_windows = int(first_n_seconds / window_size)
-    while len(base_window_stats['PayloadSizes']) <= num_windows:
-        base_window_stats['PayloadSizes'].append([])
-        base_window_stats['InterArrivalTimes'].append([])
+    window_idx = np.minimum((downstream_timestamps / window_size).astype(np.int64), num_windows - 1)
+    inter_arrivals = np.diff(downstream_timestamps, prepend=np.nan)
+    # packets are normally in time order already, sorting by window is only needed for out-of-order timestamps
+    if np.any(window_idx[1:] < window_idx[:-1]):
+        order = np.argsort(window_idx, kind='stable')
+        window_idx = window_idx[order]
+        downstream_payload_sizes = downstream_payload_sizes[order]
+        inter_arrivals = inter_arrivals[order]
+    # calculate inter-arrival times, skip for first packet in each window
+    has_inter_arrival = np.zeros(window_idx.size, dtype=bool)
+    has_inter_arrival[1:] = window_idx[1:] == window_idx[:-1]
     
-    base_timestamp = flow['Packets'][0]['Timestamp']    # UNIX microsecond timestamp
-    prev_timestamp = None
+    return {
+        'PayloadSizes': (downstream_payload_sizes, window_idx),
+        'InterArrivalTimes': (inter_arrivals[has_inter_arrival], window_idx[has_inter_arrival]),
+    }
+
+
+def get_base_window_stats(file_path: str, window_size: float, first_n_seconds: float) -> dict[str, list[list[int|float]]]:
+    num_windows = int(first_n_seconds / window_size)
+    base_window_stats = {}
+    for name, (values, window_idx) in get_base_window_arrays(file_path, window_size, first_n_seconds).items():
+        split_points = np.searchsorted(window_idx, np.arange(1, num_windows))
+        base_window_stats[name] = [group.tolist() for group in np.split(values, split_points)]
+    return base_window_stats
+
+
+def _moments(values: np.ndarray, starts: np.ndarray, counts: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Compute the mean and the 2nd, 3rd and 4th central moments of each non-empty segment of values in one sweep.
+    """
+    mean = np.add.reduceat(values, starts) / counts
+    deviations = values - np.repeat(mean, counts)
+    squared_deviations = deviations * deviations
+    m2 = np.add.reduceat(squared_deviations, starts) / counts
+    m3 = np.add.reduceat(squared_deviations * deviations, starts) / counts
+    m4 = np.add.reduceat(squared_deviations * squared_deviations, starts) / counts
+    return mean, m2, m3, m4
+
+
+def _skew(m2: np.ndarray, m3: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """
+    Biased skew from the central moments, 0 where not valid.
+    """
+    skew = np.zeros_like(m2)
+    np.divide(m3, m2 ** 1.5, out=skew, where=valid)
+    return skew
+
+
+def _kurtosis(m2: np.ndarray, m4: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """
+    Biased (Fisher) kurtosis from the central moments, 0 where not valid.
+    """
+    kurtosis = np.zeros_like(m2)
+    np.divide(m4, m2 ** 2, out=kurtosis, where=valid)
+    return np.subtract(kurtosis, 3.0, out=kurtosis, where=valid)
+
+
+def _describe(values: np.ndarray, window_idx: np.ndarray, out: np.ndarray) -> None:
+    """
+    Compute the sum, mean, med, min, max, std, kurtosis and skew of values for every window into the rows of out,
+    a (num_windows, 8) array (all 0 for an empty window). Values must be grouped by ascending window_idx.
+    Std is the sample standard deviation, kurtosis (Fisher) and skew are the biased estimators as in scipy.stats,
+    but 0 instead of NaN for (nearly) constant values.
+    """
+    counts = np.bincount(window_idx, minlength=out.shape[0])
+    nonempty = counts > 0
+    n = counts[nonempty]
+    starts = (np.cumsum(counts) - counts)[nonempty]
     
-    for packet in flow['Packets']:
-        if packet['Upstream']:
-            # skip upstream packets in video flows
-            continue
-        packet['Timestamp'] -= base_timestamp
-        packet['Timestamp'] /= 1e6    # convert to seconds
-        # only consider packets within the first n seconds
-        if packet['Timestamp'] > first_n_seconds:
-            break
-        
-        # determine which window this packet belongs to
-        window_idx = int(packet['Timestamp'] / window_size)    
-        # calculate inter-arrival time, skip for first packet in each window
-        if len(base_window_stats['PayloadSizes'][window_idx]) > 0:
-            inter_arrival = packet['Timestamp'] - prev_timestamp
-            base_window_stats['InterArrivalTimes'][window_idx].append(inter_arrival)
-        # add payload size to current window
-        base_window_stats['PayloadSizes'][window_idx].append(packet['PayloadSize'])
-        
-        # update previous timestamp for next iteration
-        prev_timestamp = packet['Timestamp']
+    mean, m2, m3, m4 = _moments(values, starts, n)
+    # min, median and max of each window from the values sorted within their window
+    sorted_values = values[np.lexsort((values, window_idx))]
+    med = (sorted_values[starts + (n - 1) // 2] + sorted_values[starts + n // 2]) / 2
+    min_values = sorted_values[starts]
+    max_values = sorted_values[starts + n - 1]
+    # m2 is 0 for a single value, so the std is 0 as well
+    std = np.sqrt(m2 * n / np.maximum(n - 1, 1))
+    # same precision threshold as scipy.stats for nearly identical values
+    constant = m2 <= (np.finfo(np.float64).eps * mean) ** 2
+    kurtosis = _kurtosis(m2, m4, (n > 3) & ~constant)
+    skew = _skew(m2, m3, (n > 2) & ~constant)
     
-    return base_window_stats
+    out[~nonempty] = 0
+    out[nonempty] = np.column_stack((np.add.reduceat(values, starts), mean, med, min_values, max_values, std, kurtosis, skew))
+
+
+@functools.lru_cache
+def window_attribute_names(num_windows: int) -> tuple[str, ...]:
+    """
+    Names of the attributes of num_windows windows, ordered by window and then as in ATTRIBUTE_NAMES.
+    """
+    return tuple(f'{attribute_name}_{window_idx}' for window_idx in range(num_windows) for attribute_name in ATTRIBUTE_NAMES)
 
 
-def generate_window_attributes(file_path: str, window_size: float = 1.0, first_n_seconds: float = 5.0) -> list[dict]:
+def generate_window_attributes(file_path: str, window_size: float = 1.0, first_n_seconds: float = 5.0) -> tuple[tuple[str, ...], np.ndarray]:
     """
     Generate window attributes from base window stats.
     For each window, 17 attributes are generated based on the packet count, payload sizes, and inter-arrival times,
     using statistical functions including sum, mean, med, min, max, std, kurtosis, skew,
     and are named as ct_sum_<window_idx>, sz_sum_<window_idx>, sz_mean_<window_idx>..., it_kurtosis_<window_idx>, it_skew_<window_idx>.
+    Returns the attribute names and a (num_windows, 17) array of their values, whose flattened rows follow the names.
     """
     if first_n_seconds % window_size != 0:
         raise ValueError("First n seconds must be a multiple of window size")
     
-    base_window_stats = get_base_window_stats(file_path, window_size, first_n_seconds)
-    if base_window_stats is None:
-        raise ValueError("No video flow found in json file: " + file_path)
+    base_window_arrays = get_base_window_arrays(file_path, window_size, first_n_seconds)
+    num_windows = int(first_n_seconds / window_size)
     
-    window_attributes = {}
-    for window_idx in range(len(base_window_stats['PayloadSizes'])):
-        # Packet count attribute
-        window_attributes[f'ct_sum_{window_idx}'] = len(base_window_stats['PayloadSizes'][window_idx])
-        
-        # Payload size attributes
-        payload_sizes = base_window_stats['PayloadSizes'][window_idx]
-        if len(payload_sizes) > 0:
-            window_attributes[f'sz_sum_{window_idx}'] = sum(payload_sizes)
-            window_attributes[f'sz_mean_{window_idx}'] = statistics.mean(payload_sizes)
-            window_attributes[f'sz_med_{window_idx}'] = statistics.median(payload_sizes)
-            window_attributes[f'sz_min_{window_idx}'] = min(payload_sizes)
-            window_attributes[f'sz_max_{window_idx}'] = max(payload_sizes)
-            window_attributes[f'sz_std_{window_idx}'] = statistics.stdev(payload_sizes) if len(payload_sizes) > 1 else 0
-            window_attributes[f'sz_kurtosis_{window_idx}'] = stats.kurtosis(payload_sizes) if len(payload_sizes) > 3 else 0
-            window_attributes[f'sz_skew_{window_idx}'] = stats.skew(payload_sizes) if len(payload_sizes) > 2 else 0
-        else:
-            window_attributes[f'sz_sum_{window_idx}'] = 0
-            window_attributes[f'sz_mean_{window_idx}'] = 0
-            window_attributes[f'sz_med_{window_idx}'] = 0
-            window_attributes[f'sz_min_{window_idx}'] = 0
-            window_attributes[f'sz_max_{window_idx}'] = 0
-            window_attributes[f'sz_std_{window_idx}'] = 0
-            window_attributes[f'sz_kurtosis_{window_idx}'] = 0
-            window_attributes[f'sz_skew_{window_idx}'] = 0
+    window_attributes = np.empty((num_windows, len(ATTRIBUTE_NAMES)), dtype=np.float64)
+    # Packet count attribute
+    window_attributes[:, CT_SUM] = np.bincount(base_window_arrays['PayloadSizes'][1], minlength=num_windows)
+    # Payload size and inter-arrival time attributes
+    _describe(*base_window_arrays['PayloadSizes'], window_attributes[:, SZ_SUM:SZ_SUM + len(STAT_NAMES)])
+    _describe(*base_window_arrays['InterArrivalTimes'], window_attributes[:, IT_SUM:IT_SUM + len(STAT_NAMES)])
+    
+    return window_attribute_names(num_windows), window_attributes
+
+
+def _format_window_attributes(window_attributes: np.ndarray) -> str:
+    """
+    Format the flattened window attributes as a CSV row, with integers for INTEGER_COLUMNS
+    and the shortest representation that round-trips each value otherwise.
+    """
+    return ','.join(repr(int(value)) if column in INTEGER_COLUMNS else repr(value)
+                    for row in window_attributes.tolist() for column, value in enumerate(row))
+
+
+def process_one(file_path: str, window_size: float, first_n_seconds: float) -> tuple[str, str|None, str|None]:
+    """
+    Generate window attributes for one packet stats file and save them to a CSV file in the same directory.
+    Returns (file_path, output_path, None) on success or (file_path, None, error message) on failure.
+    """
+    try:
+        # generate window attributes
+        attribute_names, window_attributes = generate_window_attributes(file_path, window_size, first_n_seconds)
         
-        # Inter-arrival time attributes
-        inter_arrival_times = base_window_stats['InterArrivalTimes'][window_idx]
-        if len(inter_arrival_times) > 0:
-            window_attributes[f'it_sum_{window_idx}'] = sum(inter_arrival_times)
-            window_attributes[f'it_mean_{window_idx}'] = statistics.mean(inter_arrival_times)
-            window_attributes[f'it_med_{window_idx}'] = statistics.median(inter_arrival_times)
-            window_attributes[f'it_min_{window_idx}'] = min(inter_arrival_times)
-            window_attributes[f'it_max_{window_idx}'] = max(inter_arrival_times)
-            window_attributes[f'it_std_{window_idx}'] = statistics.stdev(inter_arrival_times) if len(inter_arrival_times) > 1 else 0
-            window_attributes[f'it_kurtosis_{window_idx}'] = stats.kurtosis(inter_arrival_times) if len(inter_arrival_times) > 3 else 0
-            window_attributes[f'it_skew_{window_idx}'] = stats.skew(inter_arrival_times) if len(inter_arrival_times) > 2 else 0
-        else:
-            window_attributes[f'it_sum_{window_idx}'] = 0
-            window_attributes[f'it_mean_{window_idx}'] = 0
-            window_attributes[f'it_med_{window_idx}'] = 0
-            window_attributes[f'it_min_{window_idx}'] = 0
-            window_attributes[f'it_max_{window_idx}'] = 0
-            window_attributes[f'it_std_{window_idx}'] = 0
-            window_attributes[f'it_kurtosis_{window_idx}'] = 0
-            window_attributes[f'it_skew_{window_idx}'] = 0
+        # save to CSV file in the same directory as the json file
+        output_path = file_path.replace('_packetStats.json', '_window_attributes.csv')
+        with open(output_path, 'w', newline='') as csvfile:
+            # write header row
+            csvfile.write(','.join(attribute_names) + '\r\n')
+            # write data row
+            csvfile.write(_format_window_attributes(window_attributes) + '\r\n')
+        return file_path, output_path, None
     
-    return window_attributes
+    except Exception as e:
+        return file_path, None, str(e)
 
 
 if __name__ == "__main__":
@@ -139,7 +256,10 @@ if __name__ == "__main__":
     parser.add_argument('-p', '--path', type=str, default='../../data/', help='Base path to the data directory (default: ../../data/)')
     parser.add_argument('-w', '--window-size', type=float, default=1.0, help='Window size in seconds (default: 1.0)')
     parser.add_argument('-n', '--first-n-seconds', type=float, default=5.0, help='First n seconds to process (default: 5.0)')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='Number of files processed in parallel (default: number of CPUs)')
     args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error('argument -j/--jobs: must be at least 1')
     
     # recursively find all files ending with "_packetStats.json"
     packet_stats_files = []
@@ -150,22 +270,11 @@ if __name__ == "__main__":
     
     print(f"Found {len(packet_stats_files)} packet stats files")
     
-    for file_path in packet_stats_files:
-        print(f"Processing {file_path}...")
-        try:
-            # generate window attributes
-            window_attributes = generate_window_attributes(file_path, args.window_size, args.first_n_seconds)
-            
-            # save to CSV file in the same directory as the json file
-            output_path = file_path.replace('_packetStats.json', '_window_attributes.csv')
-            with open(output_path, 'w', newline='') as csvfile:
-                writer = csv.writer(csvfile)
-                # write header row
-                writer.writerow(window_attributes.keys())
-                # write data row
-                writer.writerow(window_attributes.values())
-            print(f"CSV file saved to {output_path}")
-            
-        except Exception as e:
-            print(f"Error processing {file_path}: {e}")
-            continue
+    # files are independent, so they are processed in a pool of worker processes
+    process_file = functools.partial(process_one, window_size=args.window_size, first_n_seconds=args.first_n_seconds)
+    with multiprocessing.Pool(args.jobs) as pool:
+        for file_path, output_path, error in pool.imap_unordered(process_file, packet_stats_files, chunksize=4):
+            if error is None:
+                print(f"CSV file saved to {output_path}")
+            else:
+                print(f"Error processing {file_path}: {error}")
@@ -8,52 +8,101 @@ import subprocess
 import re
 import sys
 import argparse
+import json
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 import time
 
 # Configuration 
 CAPINFOS_PATH = "capinfos.exe" # Change to the actual path of capinfos executable (usually in the same directory as Wireshark)
+CAPINFOS_BATCH_SIZE = 64 # Maximum number of files passed to one capinfos call
                            
 
-def get_capture_duration(file_path):
+def get_capture_durations(file_paths):
     """
-    Uses capinfos -M (machine-readable output) to get the capture duration of a pcapng file.
+    Uses a single capinfos -M (machine-readable output) call to get the capture durations of several pcapng files.
+    Returns a dict mapping each file path to its duration, or to None if the file could not be processed.
     """
     global CAPINFOS_PATH 
+    durations = dict.fromkeys(file_paths)
     try:
-        cmd = [CAPINFOS_PATH, "-M", file_path]
+        cmd = [CAPINFOS_PATH, "-M", *file_paths]
         result = subprocess.run(cmd, capture_output=True, text=True, check=False, encoding='utf-8', errors='ignore')
 
-        if result.returncode != 0:
-            # Error processing file
-            print(f"capinfos -M failed for file: {file_path}", file=sys.stderr)
-            return None
-
-        # Parse capinfos output to find the duration line
-        match = re.search(r"^Capture duration:\s+(\d+\.?\d*)\s+seconds", result.stdout, re.MULTILINE)
-
-        if match:
-            duration_str = match.group(1)
-            return float(duration_str)
-        else:
-            # Duration line not found
-            print(f"No 'Capture duration' line in capinfos output for file: {file_path}", file=sys.stderr)
-            return 0.0
+        # capinfos prints one section per file, each starting with a "File name:" line
+        for section in re.split(r"^(?=File name:)", result.stdout, flags=re.MULTILINE):
+            name_match = re.match(r"File name:\s+(.*?)\s*$", section, re.MULTILINE)
+            if name_match is None or name_match.group(1) not in durations:
+                continue
+            file_path = name_match.group(1)
+
+            # Parse capinfos output to find the duration line
+            match = re.search(r"^Capture duration:\s+(\d+\.?\d*)\s+seconds", section, re.MULTILINE)
+
+            if match:
+                duration_str = match.group(1)
+                durations[file_path] = float(duration_str)
+            else:
+                # Duration line not found
+                print(f"No 'Capture duration' line in capinfos output for file: {file_path}", file=sys.stderr)
+                durations[file_path] = 0.0
+
+        for file_path, duration in durations.items():
+            if duration is None:
+                # Error processing file
+                print(f"capinfos -M failed for file: {file_path}", file=sys.stderr)
+        return durations
 
     except FileNotFoundError:
         # capinfos not found
         print(f"'{CAPINFOS_PATH}' not found. Check the CAPINFOS_PATH variable in the script.", file=sys.stderr)
-        return None 
+        return dict.fromkeys(file_paths)
     
     except Exception as e:
         # Any other error
-        print(f"Error processing file {file_path}: {e}", file=sys.stderr)
-        return None
+        print(f"Error processing files {', '.join(file_paths)}: {e}", file=sys.stderr)
+        return dict.fromkeys(file_paths)
+
+
+def get_capture_duration(file_path):
+    """
+    Uses capinfos -M (machine-readable output) to get the capture duration of a pcapng file.
+    """
+    return get_capture_durations([file_path])[file_path]
+
+
+def load_duration_cache(cache_path):
+    """
+    Loads the capture duration cache, mapping absolute file paths to [mtime_ns, size, duration].
+    """
+    if cache_path is None or not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable duration cache {cache_path}: {e}", file=sys.stderr)
+        return {}
 
 
-def analyze_pcapng_files(root_dir='.'):
+def save_duration_cache(duration_cache, cache_path):
+    """
+    Atomically replaces the capture duration cache file with duration_cache.
+    """
+    if cache_path is None:
+        return
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(duration_cache, f)
+    os.replace(tmp_path, cache_path)
+
+
+def analyze_pcapng_files(root_dir='.', max_workers=None, cache_path=None):
     """
     Scan the directory structure, analyze pcapng files, and return summaries.
+    capinfos is run on up to max_workers files concurrently (default: twice the number of CPUs).
+    Capture durations are cached in the json file at cache_path (no caching if None).
     """
     # Data structures for storing statistics
     game_stats = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: {'count': 0, 'duration': 0.0})))
@@ -69,51 +118,76 @@ def analyze_pcapng_files(root_dir='.'):
 
     # The directory structure is:
     # root -> device_type -> software_type -> game_name -> graphics_setting -> experiment_num -> pcapng_files
-    for device_type in os.listdir(root_dir):
-        device_path = os.path.join(root_dir, device_type)
-        if not os.path.isdir(device_path): continue
-
-        for software_type in os.listdir(device_path):
-            software_path = os.path.join(device_path, software_type)
-            if not os.path.isdir(software_path): continue
-
-            for game_name in os.listdir(software_path):
-                game_path = os.path.join(software_path, game_name)
-                if not os.path.isdir(game_path): continue
-
-                for graphics_setting in os.listdir(game_path):
-                    graphics_path = os.path.join(game_path, graphics_setting)
-                    if not os.path.isdir(graphics_path): continue
-
-                    for experiment_num in os.listdir(graphics_path):
-                        experiment_path = os.path.join(graphics_path, experiment_num)
-                        if not os.path.isdir(experiment_path): continue
-
-                        for filename in os.listdir(experiment_path):
-                            if filename.lower().endswith(".pcapng"):
-                                total_files_scanned += 1
-                                file_path = os.path.join(experiment_path, filename)
-
-                                duration = get_capture_duration(file_path)
-
-                                if duration is None: 
-                                    # Stop processing if error occurs
-                                     return None 
-
-                                # Update stats for all levels
-                                game_stats[device_type][software_type][game_name]['count'] += 1
-                                game_stats[device_type][software_type][game_name]['duration'] += duration
-                                software_stats[device_type][software_type]['count'] += 1
-                                software_stats[device_type][software_type]['duration'] += duration
-                                device_stats[device_type]['count'] += 1
-                                device_stats[device_type]['duration'] += duration
-                                total_duration_all += duration
-                                processed_files += 1
-
-                                # Show progress periodically
-                                if processed_files % 50 == 0:
-                                     elapsed = time.time() - start_time
-                                     print(f"... processed {processed_files} files ({elapsed:.1f}s elapsed)", end='\r')
+    pcapng_files = []
+    for file_path in Path(root_dir).glob('*/*/*/*/*/*'):
+        if file_path.name.lower().endswith(".pcapng"):
+            device_type, software_type, game_name, _, _, _ = file_path.relative_to(root_dir).parts
+            pcapng_files.append((device_type, software_type, game_name, str(file_path)))
+
+    total_files_scanned = len(pcapng_files)
+    if max_workers is None:
+        max_workers = (os.cpu_count() or 1) * 2
+
+    # durations of files unchanged since the last run are taken from the cache
+    duration_cache = load_duration_cache(cache_path)
+    durations = {}
+    uncached_files = []
+    for _, _, _, file_path in pcapng_files:
+        file_stat = os.stat(file_path)
+        cache_entry = duration_cache.get(os.path.abspath(file_path))
+        if cache_entry is not None and cache_entry[:2] == [file_stat.st_mtime_ns, file_stat.st_size]:
+            durations[file_path] = cache_entry[2]
+        else:
+            uncached_files.append((file_path, file_stat))
+
+    # capinfos accepts many files per call, so files are passed in batches to save process start-ups,
+    # but not so large that any of the workers is left idle
+    batch_size = max(1, min(CAPINFOS_BATCH_SIZE, -(-len(uncached_files) // max_workers)))
+    batches = [uncached_files[i:i + batch_size] for i in range(0, len(uncached_files), batch_size)]
+
+    # capinfos runs in separate processes, so threads are enough to run them concurrently
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for batch in batches:
+            future = executor.submit(get_capture_durations, [file_path for file_path, _ in batch])
+            for file_path, file_stat in batch:
+                futures[file_path] = (future, file_stat)
+
+        try:
+            # aggregate in scan order so that the totals do not depend on completion order
+            for device_type, software_type, game_name, file_path in pcapng_files:
+                if file_path in durations:
+                    duration = durations[file_path]
+                else:
+                    future, file_stat = futures[file_path]
+                    duration = future.result()[file_path]
+                    if duration is not None:
+                        duration_cache[os.path.abspath(file_path)] = [file_stat.st_mtime_ns, file_stat.st_size, duration]
+
+                if duration is None:
+                    # Stop processing if error occurs
+                    for pending, _ in futures.values():
+                        pending.cancel()
+                    return None
+
+                # Update stats for all levels
+                game_stats[device_type][software_type][game_name]['count'] += 1
+                game_stats[device_type][software_type][game_name]['duration'] += duration
+                software_stats[device_type][software_type]['count'] += 1
+                software_stats[device_type][software_type]['duration'] += duration
+                device_stats[device_type]['count'] += 1
+                device_stats[device_type]['duration'] += duration
+                total_duration_all += duration
+                processed_files += 1
+
+                # Show progress periodically
+                if processed_files % 50 == 0:
+                     elapsed = time.time() - start_time
+                     print(f"... processed {processed_files} files ({elapsed:.1f}s elapsed)", end='\r')
+
+        finally:
+            # keep the durations obtained so far, even if processing stopped early
+            save_duration_cache(duration_cache, cache_path)
 
 
     print(f"\n\nScan complete. Processed {processed_files} out of {total_files_scanned} scanned files.")
@@ -194,8 +268,13 @@ def print_summary(results):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Validate cloud gaming dataset by analyzing pcap/pcapng files')
     parser.add_argument('-p', '--path', type=str, default='../data/', help='Base path to the data directory (default: ../data/)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='Number of capinfos processes run concurrently (default: twice the number of CPUs)')
+    parser.add_argument('-c', '--cache', type=str, default='durations.cache.json', help='File caching capture durations between runs (default: durations.cache.json)')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the capture duration cache')
     args = parser.parse_args()
+    if args.jobs is not None and args.jobs < 1:
+        parser.error('argument -j/--jobs: must be at least 1')
     
-    summary_results = analyze_pcapng_files(args.path)
+    summary_results = analyze_pcapng_files(args.path, args.jobs, None if args.no_cache else args.cache)
     if summary_results:
         print_summary(summary_results)
\ No newline at end of file